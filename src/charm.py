@@ -16,6 +16,8 @@ from charms.fluentbit.v0.fluentbit import FluentbitClient
 
 logger = logging.getLogger()
 
+_INVALID_CONFIG_STATUS = BlockedStatus("Invalid profiling-duration")
+
 
 class LicenseManagerAgentCharm(CharmBase):
     """Facilitate License Manager Agent lifecycle."""
@@ -45,6 +47,7 @@ class LicenseManagerAgentCharm(CharmBase):
             self.on.remove: self._on_remove,
             self.on.upgrade_action: self._on_upgrade_action,
             self.on.show_version_action: self._on_show_version_action,
+            self.on.profile_action: self._on_profile_action,
             self.on["fluentbit"].relation_created: self._on_fluentbit_relation_created,
         }
         for event, handler in event_handler_bindings.items():
@@ -87,7 +90,22 @@ class LicenseManagerAgentCharm(CharmBase):
 
     def _on_config_changed(self, event):
         """Configure license-manager-agent with charm config."""
+        # Validate before touching any file or unit so a bad value leaves the agent as is
+        try:
+            self._license_manager_agent_ops.validate_config()
+        except ValueError as e:
+            logger.error(f"Invalid charm config: {e}")
+            self.unit.status = _INVALID_CONFIG_STATUS
+            return
+
+        if self.unit.status == _INVALID_CONFIG_STATUS:
+            if self._stored.init_started:
+                self.unit.status = ActiveStatus("license-manager-agent started")
+            else:
+                self.unit.status = ActiveStatus("license-manager-agent installed")
+
         self._license_manager_agent_ops.configure_etc_default()
+        self._license_manager_agent_ops.configure_profiling()
 
         if self._stored.init_started:
             self._license_manager_agent_ops.restart_agent()
@@ -107,6 +125,18 @@ class LicenseManagerAgentCharm(CharmBase):
             self.unit.status = BlockedStatus(f"Error updating to version {version}")
             event.fail()
 
+    def _on_profile_action(self, event):
+        """Start a profile capture of license-manager-agent or report its hotspots."""
+        try:
+            if event.params["fetch"]:
+                results = self._license_manager_agent_ops.fetch_profile(event.params["top"])
+            else:
+                results = self._license_manager_agent_ops.start_profile()
+            event.set_results(results)
+        except Exception as e:
+            logger.error(f"Error capturing profile: {e}")
+            event.fail(str(e))
+
     def _on_fluentbit_relation_created(self, event):
         """Set up Fluentbit log forwarding."""
         cfg = list()
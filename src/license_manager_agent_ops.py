@@ -1,8 +1,10 @@
 """LicenseManagerAgentOps."""
 import logging
 import subprocess
+import time
 from pathlib import Path
 from shutil import chown, copy2, rmtree
+from string import Template
 
 logger = logging.getLogger()
 
@@ -15,6 +17,8 @@ class LicenseManagerAgentOps:
     _SYSTEMD_BASE_PATH = Path("/usr/lib/systemd/system")
     _SYSTEMD_SERVICE_ALIAS = f"{_PACKAGE_NAME}.service"
     _SYSTEMD_SERVICE_FILE = _SYSTEMD_BASE_PATH / _SYSTEMD_SERVICE_ALIAS
+    _SYSTEMD_DROPIN_DIR = Path(f"/etc/systemd/system/{_SYSTEMD_SERVICE_ALIAS}.d")
+    _PROFILING_DROPIN_FILE = _SYSTEMD_DROPIN_DIR / "profiling.conf"
     _VENV_DIR = Path("/srv/license-manager-agent-venv")
     _ENV_DEFAULTS = Path("/etc/default/license-manager-agent")
     _PIP_CMD = _VENV_DIR.joinpath("bin", "pip").as_posix()
@@ -23,10 +27,18 @@ class LicenseManagerAgentOps:
     _CACHE_DIR = Path("/var/cache/license-manager")
     _PROLOG_PATH = _VENV_DIR / "bin/slurmctld_prolog"
     _EPILOG_PATH = _VENV_DIR / "bin/slurmctld_epilog"
+    _PROFILER_WRAPPER_PATH = _VENV_DIR / "bin/license-manager-agent-profiled"
+    _VENV_PYTHON_CMD = _VENV_DIR.joinpath("bin", "python").as_posix()
+    _PROFILE_REQUEST = _LOG_DIR / ".profile-request"
+    _PROFILE_PENDING = _LOG_DIR / ".profile-pending"
+    # Time the wrapper gets on top of the profiling window to write the profile
+    _PROFILE_GRACE_PERIOD = 30
+    _PROFILES_TO_KEEP = 5
     _SLURM_USER = "slurm"
     _SLURM_GROUP = "slurm"
     _LICENSE_MANAGER_USER = "license-manager"
     _LICENSE_MANAGER_ACCOUNT = "license-manager"
+    _CHARM_ONLY_CONFIG = ["profiling-enabled", "profiling-duration"]
 
     def __init__(self, charm):
         """Initialize license-manager-agent-ops."""
@@ -233,6 +245,114 @@ class LicenseManagerAgentOps:
         subprocess.call(["systemctl", "daemon-reload"])
         subprocess.call(["systemctl", "enable", "--now", self._SYSTEMD_SERVICE_ALIAS])
 
+    def configure_profiling(self):
+        """Add or remove the systemd drop-in that lets the agent run under the profiler."""
+        if self._charm.model.config.get("profiling-enabled"):
+            logger.debug("Enabling license-manager-agent profiling")
+            dropin = Template(Path("./src/templates/profiling.conf").read_text()).substitute(
+                duration=self._profiling_duration()
+            )
+            copy2(
+                "./src/templates/license-manager-agent-profiled.sh",
+                self._PROFILER_WRAPPER_PATH,
+            )
+            self._SYSTEMD_DROPIN_DIR.mkdir(parents=True, exist_ok=True)
+            self._PROFILING_DROPIN_FILE.write_text(dropin)
+        elif self._PROFILING_DROPIN_FILE.exists():
+            logger.debug("Disabling license-manager-agent profiling")
+            self._PROFILING_DROPIN_FILE.unlink()
+            for capture_file in [self._PROFILE_REQUEST, self._PROFILE_PENDING]:
+                if capture_file.exists():
+                    capture_file.unlink()
+        else:
+            return
+
+        subprocess.call(["systemctl", "daemon-reload"])
+
+    def start_profile(self) -> dict:
+        """Request a profile capture and restart the agent to start it.
+
+        Returns right away with the path the profile will be written to once the
+        `profiling-duration` window is over. Use `fetch_profile` to summarize it.
+        """
+        if not self._PROFILING_DROPIN_FILE.exists():
+            raise RuntimeError("Profiling is disabled, set profiling-enabled=true first")
+
+        duration = self._profiling_duration()
+        self._prune_profiles()
+
+        profile = self._LOG_DIR / f"profile-{time.strftime('%Y%m%dT%H%M%S')}.prof"
+        self._PROFILE_REQUEST.write_text(profile.as_posix())
+        self._PROFILE_PENDING.write_text(profile.as_posix())
+
+        self.systemctl("restart")
+
+        return {"path": profile.as_posix(), "ready-in": f"{duration}s"}
+
+    def fetch_profile(self, top: int) -> dict:
+        """Summarize the profile of the last capture started with `start_profile`."""
+        if not self._PROFILE_PENDING.exists():
+            raise RuntimeError("No profile capture was started, run the profile action first")
+
+        profile = Path(self._PROFILE_PENDING.read_text().strip())
+        if profile.exists():
+            return self._summarize_profile(profile, top)
+
+        if self._PROFILE_REQUEST.exists():
+            raise RuntimeError(f"Capture of {profile.as_posix()} was never started by the agent")
+
+        ready_at = (
+            self._PROFILE_PENDING.stat().st_mtime
+            + self._profiling_duration()
+            + self._PROFILE_GRACE_PERIOD
+        )
+        if time.time() < ready_at:
+            raise RuntimeError(
+                f"Capture of {profile.as_posix()} still running, "
+                f"ready in {int(ready_at - time.time())}s"
+            )
+
+        raise RuntimeError(
+            f"Capture of {profile.as_posix()} was lost, the agent was likely restarted "
+            "during the profiling window"
+        )
+
+    def validate_config(self):
+        """Raise ValueError if the charm config can not be applied."""
+        self._profiling_duration()
+
+    def _profiling_duration(self) -> int:
+        """Return the validated length of the profiling window."""
+        duration = self._charm.model.config.get("profiling-duration")
+        if duration <= 0:
+            raise ValueError(f"profiling-duration must be greater than 0, got {duration}")
+        return duration
+
+    def _summarize_profile(self, profile: Path, top: int) -> dict:
+        """Return the path and the top-N cumulative hotspots of a profile."""
+        summary_cmd = [
+            self._VENV_PYTHON_CMD,
+            "-c",
+            "import pstats, sys; "
+            "pstats.Stats(sys.argv[1]).sort_stats('cumulative').print_stats(int(sys.argv[2]))",
+            profile.as_posix(),
+            str(top),
+        ]
+        summary = subprocess.check_output(summary_cmd, env={}).decode().strip()
+
+        return {"path": profile.as_posix(), "summary": summary}
+
+    def _profiles(self) -> list:
+        """Return the profiles of the agent, oldest first."""
+        return sorted(self._LOG_DIR.glob("profile-[0-9]*.prof"))
+
+    def _prune_profiles(self):
+        """Delete old profiles of the agent to make room for a new one."""
+        profiles = self._profiles()
+        for profile in profiles[:max(len(profiles) - self._PROFILES_TO_KEEP + 1, 0)]:
+            logger.debug(f"Removing old profile {profile.as_posix()}")
+            profile.unlink()
+
     def systemctl(self, operation: str):
         """
         Run systemctl operation for the service.
@@ -252,8 +372,11 @@ class LicenseManagerAgentOps:
         prefix = "LM_AGENT_"
         charm_config = self._charm.model.config
 
+        # The agent rejects unknown settings, so only pass on the ones it knows about
         ctxt = {
-            key.replace("-", "_").upper(): value for key, value in charm_config.items()
+            key.replace("-", "_").upper(): value
+            for key, value in charm_config.items()
+            if key not in self._CHARM_ONLY_CONFIG
         }
 
         with open(self._ENV_DEFAULTS, "w") as env_file:
@@ -281,9 +404,10 @@ class LicenseManagerAgentOps:
         self.systemctl("disable")
         if self._SYSTEMD_SERVICE_FILE.exists():
             self._SYSTEMD_SERVICE_FILE.unlink()
+        rmtree(self._SYSTEMD_DROPIN_DIR.as_posix(), ignore_errors=True)
         subprocess.call(["systemctl", "daemon-reload"])
-        if self._ETC_DEFAULT.exists():
-            self._ETC_DEFAULT.unlink()
+        if self._ENV_DEFAULTS.exists():
+            self._ENV_DEFAULTS.unlink()
         rmtree(self._LOG_DIR.as_posix(), ignore_errors=True)
         rmtree(self._CACHE_DIR.as_posix(), ignore_errors=True)
         rmtree(self._VENV_DIR.as_posix(), ignore_errors=True)
@@ -0,0 +1,19 @@
+#!/bin/bash
+# Run the agent under cProfile for a bounded window when the profile action
+# requested a capture, then run it normally. The request file holds the path
+# the profile is written to when the window closes.
+
+VENV_DIR=/srv/license-manager-agent-venv
+LOG_DIR=/var/log/license-manager-agent
+CAPTURE_REQUEST=${LOG_DIR}/.profile-request
+
+if [ -f "${CAPTURE_REQUEST}" ]; then
+    PROFILE=$(cat "${CAPTURE_REQUEST}")
+    rm -f "${CAPTURE_REQUEST}"
+
+    # Kill the agent if it does not exit on SIGINT, no profile is written then
+    timeout --signal=INT --kill-after=30 "${PROFILING_DURATION}" \
+        ${VENV_DIR}/bin/python -m cProfile -o "${PROFILE}" ${VENV_DIR}/bin/license-manager-agent
+fi
+
+exec ${VENV_DIR}/bin/license-manager-agent